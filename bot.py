@@ -1,8 +1,9 @@
 # bot.py
 import asyncio
+from datetime import datetime
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.filters import Command, CommandObject
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
 from database import (
     save_answer,
     init_db,
@@ -13,20 +14,73 @@ from database import (
     get_region_this_month,
     reset_current_month_data,
     delete_answer_current_month,
+    get_survey_progress,
+    save_last_message_id,
 )
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN,
+    RECORD_UPDATES_PATH,
+    RECORD_SALT,
+    MAX_CONCURRENT_HANDLERS,
+    INTAKE_QUEUE_SIZE,
+    BUSY_REPLIES_PER_SECOND,
+    ADMIN_IDS,
+    REPORTS_DIR,
+    REPORT_WORKERS,
+    REPORT_CACHE_TTL,
+)
+from recorder import UpdateRecorder
+from intake import PriorityGate, IntakeMiddleware, PRIORITY_ACTIVE, PRIORITY_NEW
+from reports import ReportService
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# Charts/XLSX are built in worker processes so survey traffic never waits on them
+report_service = ReportService(workers=REPORT_WORKERS, out_dir=REPORTS_DIR, cache_ttl=REPORT_CACHE_TTL)
+# Strong references to running report deliveries (asyncio keeps only weak ones)
+_report_tasks: set[asyncio.Task] = set()
+
+# Opt-in: log raw incoming updates (anonymized) so they can be replayed with replay.py
+recorder = UpdateRecorder(RECORD_UPDATES_PATH, salt=RECORD_SALT) if RECORD_UPDATES_PATH else None
+if recorder:
+    dp.update.outer_middleware(recorder)
+
 # Keep the last message id sent to each user so we can edit it in-place.
 LAST_MESSAGE_ID: dict[int, int] = {}
 
+
+def remember_message_id(user_id: int, message_id: int) -> None:
+    """Track the message to edit in-place; persisted so a restart keeps editing the same message."""
+    LAST_MESSAGE_ID[user_id] = message_id
+    try:
+        save_last_message_id(user_id, message_id)
+    except Exception:
+        pass
+
 # Minimal in-memory cache for speed. DB is the source of truth!
 user_progress: dict[int, int] = {}  # user_id -> next question index (0-based)
 selected_region: dict[int, int] = {}  # user_id -> region id chosen in current flow
 expected_open_question: dict[int, int] = {}  # user_id -> question_id awaiting free-text
 
+
+def classify_update(update: types.Update) -> int:
+    """Respondents already in the survey are served before new /start sessions."""
+    if update.callback_query:
+        return PRIORITY_ACTIVE
+    if update.message and update.message.from_user and update.message.from_user.id in expected_open_question:
+        return PRIORITY_ACTIVE
+    return PRIORITY_NEW
+
+# Bounded intake in front of the handlers (registered after the recorder so shed updates are still logged)
+intake = IntakeMiddleware(
+    PriorityGate(concurrency=MAX_CONCURRENT_HANDLERS, max_waiting=INTAKE_QUEUE_SIZE),
+    classify_update,
+    busy_text="Hozir band, birozdan so'ng qayta urinib ko'ring.",
+    busy_replies_per_second=BUSY_REPLIES_PER_SECOND,
+)
+dp.update.outer_middleware(intake)
+
 # Regional options
 REGIONS: dict[str, list[str]] = {
     "Тошкент шаҳри": [],
@@ -188,7 +242,7 @@ async def send_or_edit_question(chat_id: int, question_id: int):
             except Exception:
                 pass
         msg = await bot.send_message(chat_id=chat_id, text=text_open)
-        LAST_MESSAGE_ID[chat_id] = msg.message_id
+        remember_message_id(chat_id, msg.message_id)
         return
 
     reply_markup = build_keyboard_for_question(question_id)
@@ -208,7 +262,7 @@ async def send_or_edit_question(chat_id: int, question_id: int):
             pass
 
     msg = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
-    LAST_MESSAGE_ID[chat_id] = msg.message_id
+    remember_message_id(chat_id, msg.message_id)
 
 @dp.message(Command("start"))
 async def start(message: types.Message):
@@ -222,7 +276,7 @@ async def start(message: types.Message):
     text = "Hududingizni tanlang:"
     kb = build_region_keyboard()
     msg = await message.answer(text, reply_markup=kb)
-    LAST_MESSAGE_ID[user_id] = msg.message_id
+    remember_message_id(user_id, msg.message_id)
     user_progress[user_id] = 0
     return
 
@@ -245,9 +299,41 @@ async def region_cmd(message: types.Message):
     text = "Iltimos hududingizni tanlang!:"
     kb = build_region_keyboard()
     msg = await message.answer(text, reply_markup=kb)
-    LAST_MESSAGE_ID[user_id] = msg.message_id
+    remember_message_id(user_id, msg.message_id)
     user_progress[user_id] = 0
     return
+async def send_report(chat_id: int, month: str):
+    try:
+        # the build's files are kept on disk until this block has sent them
+        async with report_service.report(month, QUESTIONS) as paths:
+            if not paths:
+                await bot.send_message(chat_id, f"{month} uchun javoblar topilmadi.")
+                return
+            for path in paths:
+                try:
+                    await bot.send_document(chat_id, FSInputFile(path))
+                except Exception:
+                    pass
+    except Exception:
+        await bot.send_message(chat_id, f"Hisobotni tayyorlab bo'lmadi ({month}).")
+
+@dp.message(Command("report"))
+async def report_cmd(message: types.Message, command: CommandObject):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    month = (command.args or "").strip() or datetime.now().strftime("%Y-%m")
+    try:
+        # normalize ("2025-1" -> "2025-01"): the month is a cache key and compared as a string
+        month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        await message.answer("Foydalanish: /report [YYYY-MM]")
+        return
+    await message.answer(f"Hisobot tayyorlanmoqda ({month}), tayyor bo'lgach yuboriladi.")
+    # Deliver in the background so this update releases its intake slot right away
+    task = asyncio.create_task(send_report(message.chat.id, month))
+    _report_tasks.add(task)
+    task.add_done_callback(_report_tasks.discard)
+
 @dp.callback_query()
 async def handle_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
@@ -274,7 +360,7 @@ async def handle_callback(callback: types.CallbackQuery):
             if next_index < len(QUESTIONS):
                 return await send_or_edit_question(user_id, next_index)
             msg = await bot.send_message(user_id, "🎉 E'tiboringiz uchun rahmat! Siz allaqachon bu oy uchun so'rovnama to'ldirgansiz.")
-            LAST_MESSAGE_ID[user_id] = msg.message_id
+            remember_message_id(user_id, msg.message_id)
             return
         try:
             await bot.edit_message_text(
@@ -285,7 +371,7 @@ async def handle_callback(callback: types.CallbackQuery):
             )
         except Exception:
             msg = await bot.send_message(user_id, f"Tanlangan viloyat: {region}. Tanlangan tuman:", reply_markup=build_subregion_keyboard(region))
-            LAST_MESSAGE_ID[user_id] = msg.message_id
+            remember_message_id(user_id, msg.message_id)
         return await callback.answer()
 
     # 2) Subregion selection
@@ -320,7 +406,7 @@ async def handle_callback(callback: types.CallbackQuery):
         if next_index < len(QUESTIONS):
             return await send_or_edit_question(user_id, next_index)
         msg = await bot.send_message(user_id, "🎉E'tiboringiz uchun rahmat! Siz barcha savollarga savob berdingiz!")
-        LAST_MESSAGE_ID[user_id] = msg.message_id
+        remember_message_id(user_id, msg.message_id)
         return
 
     # 3) Back from subregion to region list
@@ -337,7 +423,7 @@ async def handle_callback(callback: types.CallbackQuery):
                 )
             except Exception:
                 msg = await bot.send_message(user_id, "Ilitmos hududingizni tanlang:", reply_markup=build_region_keyboard())
-                LAST_MESSAGE_ID[user_id] = msg.message_id
+                remember_message_id(user_id, msg.message_id)
             return await callback.answer()
 
     # 4) Back in questions
@@ -356,7 +442,7 @@ async def handle_callback(callback: types.CallbackQuery):
                 )
             except Exception:
                 msg = await bot.send_message(user_id, "Iltimos hududingizni tanlang:", reply_markup=build_region_keyboard())
-                LAST_MESSAGE_ID[user_id] = msg.message_id
+                remember_message_id(user_id, msg.message_id)
             return await callback.answer()
         try:
             delete_answer_current_month(user_id, qid - 1)
@@ -391,11 +477,11 @@ async def handle_callback(callback: types.CallbackQuery):
             )
         except Exception:
             msg = await bot.send_message(user_id, "Iltimos Viloyatni tanlang:", reply_markup=build_region_keyboard())
-            LAST_MESSAGE_ID[user_id] = msg.message_id
+            remember_message_id(user_id, msg.message_id)
         return
     region, subregion = region_info
     try:
-        save_answer(user_id, qid, question_text, answer_text, region, subregion)
+        next_index, _ = save_answer(user_id, qid, question_text, answer_text, region, subregion, total_questions=len(QUESTIONS))
     except Exception:
         return await callback.answer("Failed to save answer (DB error).", show_alert=True)
     try:
@@ -409,7 +495,6 @@ async def handle_callback(callback: types.CallbackQuery):
     except Exception:
         pass
     await callback.answer("Saved!")
-    next_index = get_last_answer_index(user_id)
     user_progress[user_id] = next_index
     if next_index >= len(QUESTIONS):
         final_text = "🎉 Rahmat! Siz barcha savollarga javob berdingiz"
@@ -421,12 +506,12 @@ async def handle_callback(callback: types.CallbackQuery):
                     text=final_text,
                     reply_markup=None
                 )
-                LAST_MESSAGE_ID[user_id] = callback.message.message_id
+                remember_message_id(user_id, callback.message.message_id)
                 return
         except Exception:
             pass
         msg = await bot.send_message(user_id, final_text)
-        LAST_MESSAGE_ID[user_id] = msg.message_id
+        remember_message_id(user_id, msg.message_id)
         return
     return await send_or_edit_question(user_id, next_index)
 
@@ -443,12 +528,12 @@ async def handle_text_message(message: types.Message):
     region_info = get_region_this_month(user_id)
     if not region_info:
         msg = await message.answer("Hududingizni tanlang:", reply_markup=build_region_keyboard())
-        LAST_MESSAGE_ID[user_id] = msg.message_id
+        remember_message_id(user_id, msg.message_id)
         return
     region, subregion = region_info
     question_text = QUESTIONS[qid]["text"]
     try:
-        save_answer(user_id, qid, question_text, answer_text, region, subregion)
+        next_index, _ = save_answer(user_id, qid, question_text, answer_text, region, subregion, total_questions=len(QUESTIONS))
     except Exception:
         await message.answer("Failed to save answer (DB error). Try again.")
         return
@@ -458,11 +543,10 @@ async def handle_text_message(message: types.Message):
             await bot.edit_message_text(chat_id=user_id, message_id=LAST_MESSAGE_ID[user_id], text=edited_text, reply_markup=None)
     except Exception:
         pass
-    next_index = get_last_answer_index(user_id)
     user_progress[user_id] = next_index
     if next_index >= len(QUESTIONS):
         msg = await bot.send_message(user_id, "🎉E'tiboringiz uchun rahmat! Siz barcha savollarga savob berdingiz")
-        LAST_MESSAGE_ID[user_id] = msg.message_id
+        remember_message_id(user_id, msg.message_id)
         return
     await send_or_edit_question(user_id, next_index)
 
@@ -475,12 +559,15 @@ async def resume_incomplete_on_start():
     user_ids = get_users_with_incomplete_forms(total_questions=len(QUESTIONS))
     for uid in user_ids:
         try:
+            progress = get_survey_progress(uid)
             # If user hasn't set region for this month, prompt for it first
-            if not get_region_this_month(uid):
+            if not progress or not progress["region"]:
                 msg = await bot.send_message(uid, "Ilitingizni tanlang:", reply_markup=build_region_keyboard())
-                LAST_MESSAGE_ID[uid] = msg.message_id
+                remember_message_id(uid, msg.message_id)
                 continue
-            next_index = get_last_answer_index(uid)
+            if progress["last_message_id"]:
+                LAST_MESSAGE_ID[uid] = progress["last_message_id"]
+            next_index = progress["current_question"]
             user_progress[uid] = next_index
             if next_index < len(QUESTIONS):
                 await send_or_edit_question(uid, next_index)
@@ -491,7 +578,12 @@ async def resume_incomplete_on_start():
 async def main():
     init_db()
     await resume_incomplete_on_start()
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if recorder:
+            recorder.close()
+        report_service.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -12,3 +12,22 @@ POSTGRES_CONFIG = {
     "password": os.getenv("PG_PASSWORD"),
     "port": os.getenv("PG_PORT", 5432),
 }
+
+# Opt-in raw update recording (gzip JSONL) for replay benchmarks, see replay.py.
+# RECORD_SALT is required when recording: a secret, never stored in the log.
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH")
+RECORD_SALT = os.getenv("RECORD_SALT", "")
+
+# Intake backpressure. MAX_CONCURRENT_HANDLERS limits whole handlers in flight (including
+# their Telegram round-trips), not DB connections: database calls are synchronous and
+# already run one at a time. INTAKE_QUEUE_SIZE updates may wait for a slot; beyond that
+# updates are shed and at most BUSY_REPLIES_PER_SECOND of them get a "busy" reply.
+MAX_CONCURRENT_HANDLERS = int(os.getenv("MAX_CONCURRENT_HANDLERS", 100))
+INTAKE_QUEUE_SIZE = int(os.getenv("INTAKE_QUEUE_SIZE", 1000))
+BUSY_REPLIES_PER_SECOND = int(os.getenv("BUSY_REPLIES_PER_SECOND", 20))
+
+# /report: Telegram user ids allowed to request reports, worker processes and cache
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 1))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", 600))  # seconds, current month only
@@ -3,7 +3,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from config import POSTGRES_CONFIG
 from typing import Optional, Tuple
-from datetime import datetime
+from datetime import date, datetime
 
 def get_connection():
     return psycopg2.connect(**POSTGRES_CONFIG)
@@ -44,6 +44,40 @@ def init_db():
         cur.execute("ALTER TABLE user_regions ALTER COLUMN subregion SET NOT NULL;")
     except Exception:
         pass
+    # Per-user, per-month cursor: next question, completion, region and last message id.
+    # Kept in sync with answers/user_regions inside the same transaction as each write.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS survey_progress (
+        user_id BIGINT NOT NULL,
+        month DATE NOT NULL,
+        current_question INT NOT NULL DEFAULT 0,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        region TEXT,
+        subregion TEXT,
+        last_message_id BIGINT,
+        updated_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (user_id, month)
+    );
+    """)
+    # Backfill this month's progress for users who started before the table existed
+    cur.execute("""
+    INSERT INTO survey_progress (user_id, month, current_question, region, subregion)
+    SELECT r.user_id, DATE_TRUNC('month', NOW())::date,
+           COALESCE(a.cnt, 0), r.region, r.subregion
+    FROM (
+        SELECT DISTINCT ON (user_id) user_id, region, subregion
+        FROM user_regions
+        WHERE DATE_TRUNC('month', created_at) = DATE_TRUNC('month', NOW())
+        ORDER BY user_id, created_at DESC
+    ) r
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS cnt
+        FROM answers
+        WHERE DATE_TRUNC('month', created_at) = DATE_TRUNC('month', NOW())
+        GROUP BY user_id
+    ) a ON a.user_id = r.user_id
+    ON CONFLICT (user_id, month) DO NOTHING;
+    """)
     conn.commit()
     cur.close()
     conn.close()
@@ -59,11 +93,22 @@ def delete_answer_current_month(user_id: int, question_id: int) -> None:
         """,
         (user_id, question_id),
     )
+    # Move the cursor back to the deleted question
+    cur.execute(
+        """
+        UPDATE survey_progress
+           SET current_question = LEAST(current_question, %s), completed = FALSE, updated_at = NOW()
+         WHERE user_id = %s AND month = DATE_TRUNC('month', NOW())::date;
+        """,
+        (question_id, user_id),
+    )
     conn.commit()
     cur.close()
     conn.close()
 
-def save_answer(user_id: int, question_id: int, question_text: str, answer: str, region: str, subregion: str):
+def save_answer(user_id: int, question_id: int, question_text: str, answer: str, region: str, subregion: str,
+                total_questions: int) -> Tuple[int, bool]:
+    """Store the answer and return the user's updated (current_question, completed) cursor."""
     conn = get_connection()
     cur = conn.cursor()
     # Ensure only one answer per user/question per month by replacing any existing one
@@ -82,32 +127,67 @@ def save_answer(user_id: int, question_id: int, question_text: str, answer: str,
         """,
         (user_id, question_id, question_text, answer, region, subregion),
     )
+    # Advance the cursor only when this is the question it points at. Answers from a
+    # stale keyboard (earlier or later question) are stored but leave the cursor alone,
+    # so every question below current_question is answered and completion has no gaps.
+    cur.execute(
+        """
+        INSERT INTO survey_progress (user_id, month, current_question, completed, region, subregion)
+        VALUES (%(user_id)s, DATE_TRUNC('month', NOW())::date,
+                CASE WHEN %(qid)s = 0 THEN 1 ELSE 0 END,
+                %(qid)s = 0 AND 1 >= %(total)s,
+                %(region)s, %(subregion)s)
+        ON CONFLICT (user_id, month) DO UPDATE
+           SET current_question = CASE WHEN survey_progress.current_question = %(qid)s
+                                       THEN %(qid)s + 1
+                                       ELSE survey_progress.current_question END,
+               completed = survey_progress.completed
+                           OR (survey_progress.current_question = %(qid)s AND %(qid)s + 1 >= %(total)s),
+               region = EXCLUDED.region,
+               subregion = EXCLUDED.subregion,
+               updated_at = NOW()
+        RETURNING current_question, completed;
+        """,
+        {"user_id": user_id, "qid": question_id, "total": total_questions, "region": region, "subregion": subregion},
+    )
+    current_question, completed = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
+    return current_question, completed
 
-def get_last_answer_index(user_id: int) -> int:
+def get_survey_progress(user_id: int) -> Optional[dict]:
     """
-    Return number of answers the user has submitted THIS MONTH.
-    This equals the next question index to send (0-based).
+    Return this month's progress row for the user (single primary-key read):
+    current_question, completed, region, subregion, last_message_id. None if not started.
     """
     conn = get_connection()
-    cur = conn.cursor()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute(
         """
-        SELECT COUNT(*) FROM answers
-         WHERE user_id = %s
-           AND DATE_TRUNC('month', created_at) = DATE_TRUNC('month', NOW());
+        SELECT current_question, completed, region, subregion, last_message_id
+        FROM survey_progress
+        WHERE user_id = %s AND month = DATE_TRUNC('month', NOW())::date;
         """,
         (user_id,),
     )
-    count = cur.fetchone()[0]
+    row = cur.fetchone()
     cur.close()
     conn.close()
-    return count  # next question index
+    return dict(row) if row else None
+
+def get_last_answer_index(user_id: int) -> int:
+    """
+    Return the next question index to send (0-based) for THIS MONTH.
+    """
+    progress = get_survey_progress(user_id)
+    return progress["current_question"] if progress else 0
 
 def has_completed_this_month(user_id: int, total_questions: int) -> bool:
-    return get_last_answer_index(user_id) >= total_questions
+    progress = get_survey_progress(user_id)
+    if not progress:
+        return False
+    return progress["completed"] or progress["current_question"] >= total_questions
 
 def get_users_with_incomplete_forms(total_questions: int):
     """
@@ -117,11 +197,11 @@ def get_users_with_incomplete_forms(total_questions: int):
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT user_id, COUNT(*) AS cnt
-        FROM answers
-        WHERE DATE_TRUNC('month', created_at) = DATE_TRUNC('month', NOW())
-        GROUP BY user_id
-        HAVING COUNT(*) < %s AND COUNT(*) > 0;
+        SELECT user_id
+        FROM survey_progress
+        WHERE month = DATE_TRUNC('month', NOW())::date
+          AND NOT completed
+          AND current_question > 0 AND current_question < %s;
         """,
         (total_questions,),
     )
@@ -130,37 +210,51 @@ def get_users_with_incomplete_forms(total_questions: int):
     conn.close()
     return [r[0] for r in rows]
 
-def save_region(user_id: int, region: str, subregion: str):
+def save_last_message_id(user_id: int, message_id: int) -> None:
+    """
+    Remember the message the bot edits in-place so it can be edited after a restart.
+    Upsert: /start sends the region keyboard before any progress row exists.
+    """
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO user_regions (user_id, region, subregion) VALUES (%s, %s, %s)",
-        (user_id, region, subregion),
+        """
+        INSERT INTO survey_progress (user_id, month, last_message_id)
+        VALUES (%s, DATE_TRUNC('month', NOW())::date, %s)
+        ON CONFLICT (user_id, month) DO UPDATE
+           SET last_message_id = EXCLUDED.last_message_id, updated_at = NOW();
+        """,
+        (user_id, message_id),
     )
     conn.commit()
     cur.close()
     conn.close()
 
-def get_region_this_month(user_id: int) -> Optional[Tuple[str, str]]:
+def save_region(user_id: int, region: str, subregion: str):
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO user_regions (user_id, region, subregion) VALUES (%s, %s, %s)",
+        (user_id, region, subregion),
+    )
     cur.execute(
         """
-        SELECT region, subregion
-        FROM user_regions
-        WHERE user_id = %s
-          AND DATE_TRUNC('month', created_at) = DATE_TRUNC('month', NOW())
-        ORDER BY created_at DESC
-        LIMIT 1;
+        INSERT INTO survey_progress (user_id, month, region, subregion)
+        VALUES (%s, DATE_TRUNC('month', NOW())::date, %s, %s)
+        ON CONFLICT (user_id, month) DO UPDATE
+           SET region = EXCLUDED.region, subregion = EXCLUDED.subregion, updated_at = NOW();
         """,
-        (user_id,),
+        (user_id, region, subregion),
     )
-    row = cur.fetchone()
+    conn.commit()
     cur.close()
     conn.close()
-    if not row:
+
+def get_region_this_month(user_id: int) -> Optional[Tuple[str, str]]:
+    progress = get_survey_progress(user_id)
+    if not progress or progress["region"] is None:
         return None
-    return row[0], row[1]
+    return progress["region"], progress["subregion"]
 
 def get_latest_region_timestamp_this_month(user_id: int) -> Optional[datetime]:
     """Return the datetime of the latest region record this month for a user."""
@@ -207,6 +301,33 @@ def reset_current_month_data(user_id: int) -> None:
         """,
         (user_id,),
     )
+    # Drop this month's progress cursor
+    cur.execute(
+        "DELETE FROM survey_progress WHERE user_id = %s AND month = DATE_TRUNC('month', NOW())::date;",
+        (user_id,),
+    )
     conn.commit()
     cur.close()
     conn.close()
+
+def get_answer_counts(month_start: date) -> list[Tuple[str, str, int, str, int]]:
+    """
+    Return (region, subregion, question_id, answer, count) rows for the month starting at month_start.
+    Used by reports.py, which runs in a worker process.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT COALESCE(region, 'Unknown'), COALESCE(subregion, 'Unknown'), question_id, answer, COUNT(*)
+        FROM answers
+        WHERE created_at >= %s AND created_at < %s::date + INTERVAL '1 month'
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1, 2, 3, 4;
+        """,
+        (month_start, month_start),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
@@ -0,0 +1,131 @@
+# intake.py
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Priority classes, lower value is served first
+PRIORITY_ACTIVE = 0  # answers and navigation of a survey already in progress
+PRIORITY_NEW = 1  # /start, /region, /my_region and other new sessions
+
+
+class PriorityGate:
+    """
+    Concurrency limiter with a bounded, priority-ordered waiting queue.
+    At most `concurrency` holders run at once; at most `max_waiting` wait.
+    When the queue is full, a newcomer evicts the least urgent waiter if it outranks it,
+    otherwise the newcomer itself is rejected.
+    """
+
+    def __init__(self, concurrency: int, max_waiting: int):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self._active = 0
+        self._waiting: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    async def acquire(self, priority: int) -> bool:
+        """Wait for a slot. Returns False if the request was shed and must not run."""
+        if self._active < self.concurrency and not self._waiting:
+            self._active += 1
+            return True
+        if len(self._waiting) >= self.max_waiting:
+            if not self._waiting:
+                # max_waiting == 0: no queue at all, shed when every slot is busy
+                return False
+            worst = max(self._waiting)
+            if worst[0] <= priority:
+                return False
+            self._waiting.remove(worst)
+            heapq.heapify(self._waiting)
+            worst[2].set_result(False)
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiting, entry)
+        try:
+            return await entry[2]
+        except asyncio.CancelledError:
+            fut = entry[2]
+            if fut.done() and not fut.cancelled() and fut.result():
+                # a slot was handed over just before cancellation, pass it on
+                self.release()
+            elif entry in self._waiting:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+
+    def release(self) -> None:
+        # Hand the slot straight to the most urgent waiter, the active count stays the same
+        while self._waiting:
+            _, _, fut = heapq.heappop(self._waiting)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self._active -= 1
+
+
+class IntakeMiddleware(BaseMiddleware):
+    """
+    Outer middleware on dp.update: every update waits for a PriorityGate slot before
+    reaching the handlers. Shed updates are dropped; at most `busy_replies_per_second`
+    of them get a short "busy" reply, the rest are dropped quietly so a burst does not
+    turn into a burst of Bot API calls.
+    """
+
+    def __init__(
+        self,
+        gate: PriorityGate,
+        classify: Callable[[Update], int],
+        busy_text: str,
+        busy_replies_per_second: int,
+    ):
+        self.gate = gate
+        self.classify = classify
+        self.busy_text = busy_text
+        self.busy_replies_per_second = busy_replies_per_second
+        self._busy_window = 0
+        self._busy_sent = 0
+        self.shed = 0  # updates dropped since start, reported by replay.py
+
+    def _busy_reply_allowed(self) -> bool:
+        window = int(time.monotonic())
+        if window != self._busy_window:
+            self._busy_window = window
+            self._busy_sent = 0
+        if self._busy_sent >= self.busy_replies_per_second:
+            return False
+        self._busy_sent += 1
+        return True
+
+    async def _reply_busy(self, event: Update, bot) -> None:
+        if not self._busy_reply_allowed():
+            return
+        try:
+            if event.callback_query:
+                await bot.answer_callback_query(event.callback_query.id, text=self.busy_text)
+            elif event.message:
+                await bot.send_message(event.message.chat.id, self.busy_text)
+        except Exception:
+            pass
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Optional[Any]:
+        if not await self.gate.acquire(self.classify(event)):
+            self.shed += 1
+            await self._reply_busy(event, data["bot"])
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            self.gate.release()
@@ -0,0 +1,128 @@
+# recorder.py
+import gzip
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Keys that always hold a Telegram user/chat object. Objects elsewhere (forward origins,
+# new_chat_members, external replies, ...) are recognised by their shape, see _is_identity.
+_IDENTITY_KEYS = {"from", "chat", "user", "sender_chat"}
+_CHAT_TYPES = {"private", "group", "supergroup", "channel"}
+# Personal fields required by the Telegram models: replaced with a placeholder.
+_PLACEHOLDER_FIELDS = {"first_name": "user"}
+# Optional personal fields: dropped entirely from identity objects.
+_PERSONAL_FIELDS = {"last_name", "username", "phone_number", "title", "bio"}
+# Names outside identity objects: required ones get a placeholder, the rest are dropped.
+_NAME_PLACEHOLDERS = {"sender_user_name": "user"}
+_DROPPED_FIELDS = {"author_signature", "contact", "location"}
+
+
+def pseudonymize_id(value: int, salt: str) -> int:
+    """Map a Telegram id to a stable positive int (same user -> same id within one salt)."""
+    digest = hashlib.sha256(f"{salt}:{value}".encode()).hexdigest()
+    return int(digest[:12], 16)
+
+
+def _is_identity(data: dict, parent_key: Optional[str]) -> bool:
+    """True for a serialized User or Chat, wherever it sits in the update."""
+    if parent_key in _IDENTITY_KEYS:
+        return True
+    return "id" in data and ("is_bot" in data or "first_name" in data or data.get("type") in _CHAT_TYPES)
+
+
+def anonymize(data: Any, salt: str, parent_key: Optional[str] = None) -> Any:
+    """
+    Strip personal data from a serialized update.
+    - user/chat ids are replaced with salted hashes, first_name becomes a placeholder,
+      other names and usernames are dropped
+    - free text (open answers) is replaced with a same-length placeholder; commands are kept
+    - callback_data is kept as-is, it only carries survey indices
+    """
+    if isinstance(data, list):
+        return [anonymize(item, salt, parent_key) for item in data]
+    if not isinstance(data, dict):
+        return data
+    identity = _is_identity(data, parent_key)
+    result = {}
+    for key, value in data.items():
+        if identity:
+            if key in _PLACEHOLDER_FIELDS:
+                result[key] = _PLACEHOLDER_FIELDS[key]
+                continue
+            if key in _PERSONAL_FIELDS:
+                continue
+            if key == "id" and isinstance(value, int):
+                result[key] = pseudonymize_id(value, salt)
+                continue
+        if key in _NAME_PLACEHOLDERS:
+            result[key] = _NAME_PLACEHOLDERS[key]
+            continue
+        if key in _DROPPED_FIELDS:
+            continue
+        if key in ("text", "caption") and isinstance(value, str) and not value.startswith("/"):
+            result[key] = "x" * len(value)
+            continue
+        result[key] = anonymize(value, salt, key)
+    return result
+
+
+class UpdateRecorder(BaseMiddleware):
+    """
+    Outer middleware on dp.update that appends every incoming update to a gzip'ed JSONL log.
+    Each line is {"ts": wall-clock unix time, "update": <anonymized update>}; wall-clock time keeps
+    the gaps correct when one log is appended to across bot restarts.
+    """
+
+    def __init__(self, path: str, salt: str):
+        # Telegram ids span ~10^10 values: without a secret salt the hashes can be brute-forced
+        if not salt:
+            raise ValueError("RECORD_SALT must be set to a secret value to record updates")
+        self.path = path
+        self.salt = salt
+        self._file = None
+
+    def _write(self, update: Update) -> None:
+        if self._file is None:
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+        record = {
+            "ts": round(time.time(), 4),
+            "update": anonymize(raw, self.salt),
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            self._write(event)
+        except Exception:
+            # recording must never break the survey flow
+            pass
+        return await handler(event, data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_records(path: str):
+    """Yield (seconds since the first record, update_dict) pairs from a recorded log."""
+    first_ts = None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if first_ts is None:
+                first_ts = record["ts"]
+            yield record["ts"] - first_ts, record["update"]
@@ -0,0 +1,185 @@
+# replay.py
+"""
+Replay a recorded update log (see recorder.py) against the bot handlers.
+
+Telegram is replaced with a stub session (no network), the database is a scratch
+Postgres database given with --database. Prints per-handler latency and DB call counts.
+Updates still pass through the intake gate (see intake.py) and the number it shed is
+reported; size it for the replay with MAX_CONCURRENT_HANDLERS / INTAKE_QUEUE_SIZE.
+
+    python replay.py updates.jsonl.gz --database omonat_replay --speed 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional
+
+from recorder import load_records
+
+# Handler currently running in this task, used to attribute DB calls.
+current_handler: ContextVar[str] = ContextVar("current_handler", default="<outside handler>")
+
+handler_latency: dict[str, list[float]] = defaultdict(list)
+db_calls: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+api_calls: dict[str, int] = defaultdict(int)
+
+
+def _make_stub_session():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+
+    class StubSession(BaseSession):
+        """Answers every Bot API method locally; sent messages get increasing message ids."""
+
+        def __init__(self):
+            super().__init__()
+            self._next_message_id = 1
+
+        async def make_request(self, bot, method, timeout=None):
+            api_calls[type(method).__name__] += 1
+            if method.__returning__ is Message:
+                self._next_message_id += 1
+                return Message(
+                    message_id=self._next_message_id,
+                    date=datetime.now(),
+                    chat=Chat(id=int(getattr(method, "chat_id", 0) or 0), type="private"),
+                    text=getattr(method, "text", None),
+                )
+            return True
+
+        def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            # No handler downloads files; fail loudly if one starts to
+            raise NotImplementedError(f"replay stub cannot download files ({url})")
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+
+def _count_db_calls(module) -> None:
+    """Wrap the database functions imported into the bot module to count calls per handler."""
+    for name in dir(module):
+        func = getattr(module, name)
+        if not callable(func) or getattr(func, "__module__", None) != "database":
+            continue
+
+        def make_wrapper(f, fname):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                db_calls[current_handler.get()][fname] += 1
+                return f(*args, **kwargs)
+            return wrapper
+
+        setattr(module, name, make_wrapper(func, name))
+
+
+async def _timing_middleware(
+    handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+    event: Any,
+    data: dict[str, Any],
+) -> Any:
+    handler_obj = data.get("handler")
+    name = handler_obj.callback.__name__ if handler_obj else "<unhandled>"
+    token = current_handler.set(name)
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        handler_latency[name].append(time.perf_counter() - started)
+        current_handler.reset(token)
+
+
+async def replay(path: str, speed: float, limit: Optional[int] = None) -> int:
+    import bot as bot_module
+    from aiogram import Bot
+    from aiogram.types import Update
+
+    _count_db_calls(bot_module)
+    stub_bot = Bot(token="123456:replay", session=_make_stub_session())
+    # Handlers use the module-level bot, point it at the stub too.
+    bot_module.bot = stub_bot
+    dp = bot_module.dp
+    dp.message.middleware(_timing_middleware)
+    dp.callback_query.middleware(_timing_middleware)
+
+    bot_module.init_db()
+
+    errors = 0
+    invalid = 0
+
+    async def feed(raw: dict):
+        nonlocal errors, invalid
+        try:
+            update = Update.model_validate(raw)
+        except Exception:
+            invalid += 1
+            return
+        try:
+            await dp.feed_update(stub_bot, update)
+        except Exception:
+            errors += 1
+
+    tasks = []
+    started = time.monotonic()
+    for n, (offset, raw) in enumerate(load_records(path)):
+        if limit is not None and n >= limit:
+            break
+        if speed > 0:
+            delay = offset / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(raw)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    print(f"Replayed {len(tasks)} updates in {elapsed:.2f}s ({errors} handler errors, {invalid} invalid records)")
+    # Shed updates never reach a handler, so they are missing from the latency table below
+    print(f"Shed by the intake gate: {bot_module.intake.shed} updates"
+          f" (MAX_CONCURRENT_HANDLERS={bot_module.MAX_CONCURRENT_HANDLERS},"
+          f" INTAKE_QUEUE_SIZE={bot_module.INTAKE_QUEUE_SIZE})")
+    await stub_bot.session.close()
+    return len(tasks)
+
+
+def print_report() -> None:
+    print(f"\n{'handler':<28}{'calls':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, samples in sorted(handler_latency.items()):
+        ms = sorted(s * 1000 for s in samples)
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        print(f"{name:<28}{len(ms):>8}{statistics.mean(ms):>10.2f}{statistics.median(ms):>10.2f}{p95:>10.2f}{ms[-1]:>10.2f}")
+
+    print(f"\n{'handler':<28}{'db function':<36}{'calls':>8}")
+    for name, funcs in sorted(db_calls.items()):
+        for fname, count in sorted(funcs.items()):
+            print(f"{name:<28}{fname:<36}{count:>8}")
+
+    print(f"\n{'bot api method':<36}{'calls':>8}")
+    for method, count in sorted(api_calls.items()):
+        print(f"{method:<36}{count:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded update log against the bot handlers.")
+    parser.add_argument("log", help="gzip JSONL file written by RECORD_UPDATES_PATH")
+    parser.add_argument("--database", required=True, help="scratch Postgres database name (overrides PG_DB)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 10 = 10x faster, 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N updates")
+    args = parser.parse_args()
+
+    # Must happen before bot/config are imported: load_dotenv() does not override these.
+    os.environ["PG_DB"] = args.database
+    os.environ["RECORD_UPDATES_PATH"] = ""
+    os.environ.setdefault("BOT_TOKEN", "123456:replay")
+
+    asyncio.run(replay(args.log, args.speed, args.limit))
+    print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# reports.py
+import asyncio
+import os
+import re
+import shutil
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from multiprocessing import get_context
+
+from database import get_answer_counts
+
+OTHER_ANSWER = "Бошқа (очиқ жавоб)"
+
+
+# ---------------------------
+# Worker side (runs in a separate process, never on the bot's event loop)
+# ---------------------------
+def _sheet_title(name: str) -> str:
+    # Excel sheet names: max 31 chars, no []:*?/\
+    return re.sub(r"[\[\]:*?/\\]", " ", name)[:31] or "Sheet"
+
+
+def _option_counts(counter: Counter, options: list[str]) -> list[tuple[str, int]]:
+    """Counts in the question's option order; free-text answers are folded into one bar."""
+    known = [(o, counter.get(o, 0)) for o in options]
+    other = sum(c for a, c in counter.items() if a not in options)
+    if other:
+        known.append((OTHER_ANSWER, other))
+    return known
+
+
+def _render_charts(totals: dict[int, Counter], questions: list[dict], out_dir: str) -> list[str]:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    paths = []
+    for qid, q in enumerate(questions):
+        counts = _option_counts(totals.get(qid, Counter()), q.get("options") or [])
+        if not any(c for _, c in counts):
+            continue
+        labels = [a for a, _ in counts]
+        values = [c for _, c in counts]
+        fig, ax = plt.subplots(figsize=(8, 0.5 * len(labels) + 1.5))
+        ax.barh(labels, values)
+        ax.invert_yaxis()
+        ax.set_title(q["text"], fontsize=10, wrap=True)
+        for i, v in enumerate(values):
+            ax.text(v, i, f" {v}", va="center")
+        fig.tight_layout()
+        path = os.path.join(out_dir, f"q{qid + 1:02d}.png")
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def _render_xlsx(rows, questions: list[dict], month: str, out_dir: str) -> str:
+    from openpyxl import Workbook
+
+    def question_text(qid: int) -> str:
+        return questions[qid]["text"] if 0 <= qid < len(questions) else str(qid)
+
+    wb = Workbook()
+    summary = wb.active
+    summary.title = "Jami"
+    summary.append(["Савол", "Жавоб", "Сони"])
+    totals: dict[tuple[int, str], int] = defaultdict(int)
+    by_region: dict[str, list] = defaultdict(list)
+    for region, subregion, qid, answer, count in rows:
+        totals[(qid, answer)] += count
+        by_region[region].append((subregion, qid, answer, count))
+    for (qid, answer), count in sorted(totals.items()):
+        summary.append([question_text(qid), answer, count])
+
+    for region in sorted(by_region):
+        ws = wb.create_sheet(_sheet_title(region))
+        ws.append(["Туман", "Савол", "Жавоб", "Сони"])
+        for subregion, qid, answer, count in by_region[region]:
+            ws.append([subregion, question_text(qid), answer, count])
+
+    path = os.path.join(out_dir, f"report_{month}.xlsx")
+    wb.save(path)
+    return path
+
+
+def build_report(month: str, questions: list[dict], out_dir: str) -> list[str]:
+    """
+    Aggregate answers of `month` ("YYYY-MM") and render PNG charts per question
+    plus a multi-sheet XLSX by region. Returns file paths ([] if there is no data).
+    """
+    month_start = datetime.strptime(month, "%Y-%m").date()
+    rows = get_answer_counts(month_start)
+    if not rows:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    totals: dict[int, Counter] = defaultdict(Counter)
+    for _, _, qid, answer, count in rows:
+        totals[qid][answer] += count
+    paths = _render_charts(totals, questions, out_dir)
+    paths.append(_render_xlsx(rows, questions, month, out_dir))
+    return paths
+
+
+# ---------------------------
+# Bot side
+# ---------------------------
+class ReportService:
+    """
+    Runs build_report in a process pool. Requests for a month that is already being built
+    share the same job; finished results are cached (past months for good, the current
+    month for cache_ttl seconds since its answers keep coming in).
+    Each build gets its own directory; older builds of a month are deleted once no
+    delivery is using them any more.
+    """
+
+    def __init__(self, workers: int, out_dir: str, cache_ttl: int):
+        self.out_dir = out_dir
+        self.cache_ttl = cache_ttl
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        self._pending: dict[str, tuple[asyncio.Future, str]] = {}  # month -> (job, build_dir)
+        self._cache: dict[str, tuple[float, str, list[str]]] = {}  # month -> (built_at, build_dir, paths)
+        self._in_use: dict[str, int] = defaultdict(int)  # build_dir -> deliveries still sending it
+
+    def _cached(self, month: str):
+        entry = self._cache.get(month)
+        if not entry:
+            return None
+        built_at, build_dir, paths = entry
+        is_past = month < datetime.now().strftime("%Y-%m")
+        if is_past or time.monotonic() - built_at < self.cache_ttl:
+            return build_dir, paths
+        return None
+
+    async def _get(self, month: str, questions: list[dict]) -> tuple[str, list[str]]:
+        cached = self._cached(month)
+        if cached is not None:
+            return cached
+        pending = self._pending.get(month)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            # A fresh directory per build: a rebuild must not overwrite files that an
+            # earlier delivery is still uploading
+            build_dir = os.path.join(self.out_dir, month, datetime.now().strftime("%Y%m%d-%H%M%S-%f"))
+            job = loop.run_in_executor(self._executor, build_report, month, questions, build_dir)
+            self._pending[month] = (job, build_dir)
+            job.add_done_callback(lambda f: self._finish(month, build_dir, f))
+        else:
+            job, build_dir = pending
+        return build_dir, await asyncio.shield(job)
+
+    @asynccontextmanager
+    async def report(self, month: str, questions: list[dict]):
+        """
+        Yield the report file paths for `month` ([] if there is no data). The files stay
+        on disk until the block exits, even if a newer build replaces them meanwhile.
+        """
+        build_dir, paths = await self._get(month, questions)
+        self._in_use[build_dir] += 1
+        try:
+            yield paths
+        finally:
+            self._in_use[build_dir] -= 1
+            if not self._in_use[build_dir]:
+                del self._in_use[build_dir]
+            self._prune(month)
+
+    def _finish(self, month: str, build_dir: str, job: asyncio.Future) -> None:
+        self._pending.pop(month, None)
+        if job.cancelled() or job.exception() is not None:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            return
+        self._cache[month] = (time.monotonic(), build_dir, job.result())
+        self._prune(month)
+
+    def _prune(self, month: str) -> None:
+        """Delete builds of `month` that are neither cached nor being delivered (incl. earlier runs)."""
+        entry = self._cache.get(month)
+        keep = {entry[1]} if entry else set()
+        if month in self._pending:
+            keep.add(self._pending[month][1])
+        month_dir = os.path.join(self.out_dir, month)
+        if not os.path.isdir(month_dir):
+            return
+        for name in os.listdir(month_dir):
+            path = os.path.join(month_dir, name)
+            if path in keep or self._in_use.get(path):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,71 @@
+# test_intake.py
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from intake import IntakeMiddleware, PriorityGate, PRIORITY_ACTIVE, PRIORITY_NEW
+
+
+async def _run(gate: PriorityGate, jobs: list[tuple[int, str]]) -> list:
+    order = []
+
+    async def job(priority: int, name: str):
+        if not await gate.acquire(priority):
+            order.append(("shed", name))
+            return
+        await asyncio.sleep(0.01)
+        order.append(name)
+        gate.release()
+
+    await asyncio.gather(*(job(p, n) for p, n in jobs))
+    return order
+
+
+def test_active_respondents_evict_new_sessions():
+    gate = PriorityGate(concurrency=1, max_waiting=2)
+    order = asyncio.run(_run(gate, [
+        (PRIORITY_NEW, "a"),
+        (PRIORITY_NEW, "b"),
+        (PRIORITY_NEW, "c"),
+        (PRIORITY_ACTIVE, "d"),  # queue full: evicts c, the newest new session
+        (PRIORITY_NEW, "e"),  # queue full, nothing less urgent to evict
+    ]))
+    assert order == [("shed", "e"), ("shed", "c"), "a", "d", "b"]
+    assert gate.waiting == 0
+
+
+def test_no_queue_sheds_when_all_slots_busy():
+    gate = PriorityGate(concurrency=1, max_waiting=0)
+    order = asyncio.run(_run(gate, [(PRIORITY_NEW, "a"), (PRIORITY_ACTIVE, "b")]))
+    assert order == [("shed", "b"), "a"]
+
+
+def test_busy_replies_are_rate_limited(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("intake.time.monotonic", lambda: now[0])
+    middleware = IntakeMiddleware(PriorityGate(1, 1), lambda u: PRIORITY_NEW, "busy", busy_replies_per_second=2)
+    assert [middleware._busy_reply_allowed() for _ in range(4)] == [True, True, False, False]
+    now[0] = 101.2
+    assert middleware._busy_reply_allowed()
+
+
+def test_shed_updates_are_counted():
+    class FakeBot:
+        async def send_message(self, chat_id, text):
+            pass
+
+    async def handler(event, data):
+        await asyncio.sleep(0.01)
+
+    class Event:
+        callback_query = None
+        message = type("M", (), {"chat": type("C", (), {"id": 1})})()
+
+    async def main():
+        middleware = IntakeMiddleware(PriorityGate(1, 0), lambda u: PRIORITY_NEW, "busy", busy_replies_per_second=0)
+        await asyncio.gather(*(middleware(handler, Event(), {"bot": FakeBot()}) for _ in range(3)))
+        return middleware.shed
+
+    assert asyncio.run(main()) == 2
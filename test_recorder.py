@@ -0,0 +1,120 @@
+# test_recorder.py
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.types import (
+    CallbackQuery,
+    Chat,
+    ExternalReplyInfo,
+    Message,
+    MessageOriginHiddenUser,
+    MessageOriginUser,
+    Update,
+    User,
+)
+
+from recorder import UpdateRecorder, anonymize, load_records, pseudonymize_id
+
+
+def _updates() -> list[Update]:
+    user = User(id=42, is_bot=False, first_name="Ali", last_name="Valiyev", username="ali")
+    chat = Chat(id=42, type="private", first_name="Ali", username="ali")
+    start = Message(message_id=1, date=datetime.now(), chat=chat, from_user=user, text="/start")
+    open_answer = Message(message_id=3, date=datetime.now(), chat=chat, from_user=user, text="Juda yaxshi")
+    bot_message = Message(message_id=2, date=datetime.now(), chat=chat, text="❓ 3. Ёшингиз неччида?")
+    callback = CallbackQuery(id="7", from_user=user, chat_instance="1", message=bot_message, data="0:1")
+    return [
+        Update(update_id=1, message=start),
+        Update(update_id=2, callback_query=callback),
+        Update(update_id=3, message=open_answer),
+    ]
+
+
+def test_recorded_updates_replay(tmp_path):
+    path = str(tmp_path / "updates.jsonl.gz")
+
+    async def record():
+        async def handler(event, data):
+            return None
+
+        # Two recorder instances append to the same log, like two bot runs
+        for updates in (_updates()[:2], _updates()[2:]):
+            recorder = UpdateRecorder(path, salt="s")
+            for update in updates:
+                await recorder(handler, update, {})
+            recorder.close()
+
+    asyncio.run(record())
+    records = list(load_records(path))
+    assert len(records) == 3
+    offsets = [offset for offset, _ in records]
+    assert offsets[0] == 0 and offsets == sorted(offsets)
+
+    # What replay.py does with every record
+    start, callback, open_answer = (Update.model_validate(raw) for _, raw in records)
+    hashed = pseudonymize_id(42, "s")
+    assert start.message.text == "/start"
+    assert start.message.from_user.id == hashed
+    assert start.message.from_user.first_name == "user"
+    assert start.message.from_user.username is None
+    assert start.message.from_user.last_name is None
+    assert callback.callback_query.from_user.id == hashed
+    assert callback.callback_query.message.chat.id == hashed
+    assert callback.callback_query.data == "0:1"
+    assert open_answer.message.text == "x" * len("Juda yaxshi")
+
+
+def _dump(update: Update) -> dict:
+    return update.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def _assert_no_personal_data(raw: dict) -> None:
+    text = str(raw)
+    for leaked in ("Ali", "Valiyev", "Vali", "Karimov", "ali", "vali", "hidden name", "Signer", "1001", "2002", "3003"):
+        assert leaked not in text
+
+
+def test_users_outside_from_and_chat_are_anonymized():
+    user = User(id=42, is_bot=False, first_name="Ali")
+    chat = Chat(id=42, type="private")
+    forwarded_from = User(id=1001, is_bot=False, first_name="Vali", last_name="Karimov", username="vali")
+    joined = User(id=2002, is_bot=False, first_name="Vali", username="vali")
+    replied_to = User(id=3003, is_bot=False, first_name="Ali", last_name="Valiyev")
+    forwarded = Message(
+        message_id=1, date=datetime.now(), chat=chat, from_user=user, text="salom",
+        forward_origin=MessageOriginUser(date=datetime.now(), sender_user=forwarded_from),
+        external_reply=ExternalReplyInfo(
+            origin=MessageOriginUser(date=datetime.now(), sender_user=replied_to),
+        ),
+        author_signature="Signer",
+    )
+    hidden = Message(
+        message_id=2, date=datetime.now(), chat=chat, from_user=user, text="salom",
+        forward_origin=MessageOriginHiddenUser(date=datetime.now(), sender_user_name="hidden name"),
+    )
+    joined_msg = Message(message_id=3, date=datetime.now(), chat=chat, new_chat_members=[joined], left_chat_member=joined)
+
+    for update in (
+        Update(update_id=1, message=forwarded),
+        Update(update_id=2, message=hidden),
+        Update(update_id=3, message=joined_msg),
+    ):
+        raw = anonymize(_dump(update), "s")
+        _assert_no_personal_data(raw)
+        Update.model_validate(raw)  # still replayable
+
+    raw = anonymize(_dump(Update(update_id=1, message=forwarded)), "s")
+    assert raw["message"]["forward_origin"]["sender_user"]["id"] == pseudonymize_id(1001, "s")
+    assert raw["message"]["external_reply"]["origin"]["sender_user"]["id"] == pseudonymize_id(3003, "s")
+    raw = anonymize(_dump(Update(update_id=3, message=joined_msg)), "s")
+    assert raw["message"]["new_chat_members"][0]["id"] == pseudonymize_id(2002, "s")
+    assert raw["message"]["left_chat_member"]["id"] == pseudonymize_id(2002, "s")
+
+
+def test_recorder_requires_salt(tmp_path):
+    with pytest.raises(ValueError):
+        UpdateRecorder(str(tmp_path / "updates.jsonl.gz"), salt="")
@@ -0,0 +1,111 @@
+# test_reports.py
+import asyncio
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import reports
+from reports import OTHER_ANSWER, ReportService, _option_counts, _sheet_title, build_report
+
+QUESTIONS = [
+    {"text": "1. Ёшингиз?", "options": ["18–24", "25–34"]},
+    {"text": "2. Таклифингиз?", "options": ["Ҳа", "Очиқ жавоб"]},
+]
+ROWS = [
+    ("Тошкент шаҳри", "Тошкент шаҳри", 0, "18–24", 3),
+    ("Жиззах вилояти", "Зомин тумани", 0, "25–34", 2),
+    ("Жиззах вилояти", "Зомин тумани", 1, "Ҳа", 1),
+    ("Жиззах вилояти", "Зомин тумани", 1, "Яхши", 4),
+]
+
+
+def test_free_text_answers_fold_into_other():
+    counts = _option_counts(Counter({"Ҳа": 2, "Яхши": 1, "Ёмон": 3}), ["Ҳа", "Йўқ"])
+    assert counts == [("Ҳа", 2), ("Йўқ", 0), (OTHER_ANSWER, 4)]
+    assert _option_counts(Counter({"Ҳа": 1}), ["Ҳа"]) == [("Ҳа", 1)]
+
+
+def test_sheet_titles_are_valid_excel_names():
+    assert _sheet_title("Қорақалпоғистон Республикаси") == "Қорақалпоғистон Республикаси"
+    assert _sheet_title("a/b:c*d?e[f]g\\h") == "a b c d e f g h"
+    assert len(_sheet_title("x" * 40)) == 31
+
+
+def test_build_report_writes_charts_and_region_sheets(tmp_path, monkeypatch):
+    pytest.importorskip("matplotlib")
+    openpyxl = pytest.importorskip("openpyxl")
+    monkeypatch.setattr(reports, "get_answer_counts", lambda month_start: ROWS)
+
+    paths = build_report("2025-01", QUESTIONS, str(tmp_path / "build"))
+    assert [os.path.basename(p) for p in paths] == ["q01.png", "q02.png", "report_2025-01.xlsx"]
+    assert all(os.path.getsize(p) > 0 for p in paths)
+    wb = openpyxl.load_workbook(paths[-1])
+    assert wb.sheetnames == ["Jami", "Жиззах вилояти", "Тошкент шаҳри"]
+    assert ["Зомин тумани", "2. Таклифингиз?", "Яхши", 4] in [list(r) for r in wb["Жиззах вилояти"].values]
+
+    monkeypatch.setattr(reports, "get_answer_counts", lambda month_start: [])
+    assert build_report("2025-02", QUESTIONS, str(tmp_path / "empty")) == []
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """ReportService with a thread pool and a fake build_report that counts its calls."""
+    calls = []
+
+    def fake_build(month, questions, out_dir):
+        calls.append(month)
+        os.makedirs(out_dir)
+        path = os.path.join(out_dir, "report.xlsx")
+        open(path, "w").close()
+        return [path]
+
+    monkeypatch.setattr(reports, "build_report", fake_build)
+    svc = ReportService(workers=1, out_dir=str(tmp_path), cache_ttl=0)
+    svc._executor.shutdown()
+    svc._executor = ThreadPoolExecutor(max_workers=1)
+    svc.calls = calls
+    yield svc
+    svc._executor.shutdown()
+
+
+def test_concurrent_requests_share_one_job_and_past_months_stay_cached(service):
+    async def fetch(month):
+        async with service.report(month, QUESTIONS) as paths:
+            return paths
+
+    async def main():
+        first, second = await asyncio.gather(fetch("2000-01"), fetch("2000-01"))
+        assert first == second
+        await fetch("2000-01")  # past month: cached despite cache_ttl=0
+        assert service.calls == ["2000-01"]
+
+        current = datetime.now().strftime("%Y-%m")
+        await fetch(current)
+        await fetch(current)  # current month: cache_ttl=0 forces a rebuild
+        assert service.calls == ["2000-01", current, current]
+
+    asyncio.run(main())
+
+
+def test_replaced_builds_are_deleted_once_delivered(service):
+    current = datetime.now().strftime("%Y-%m")
+    leftover = os.path.join(service.out_dir, current, "from-an-earlier-run")
+    os.makedirs(leftover)
+
+    async def main():
+        async with service.report(current, QUESTIONS) as old_paths:
+            assert not os.path.exists(leftover)
+            async with service.report(current, QUESTIONS) as new_paths:
+                assert new_paths != old_paths
+                # the older build is still being delivered
+                assert os.path.exists(old_paths[0])
+        assert not os.path.exists(old_paths[0])
+        assert os.path.exists(new_paths[0])
+        assert os.listdir(os.path.join(service.out_dir, current)) == [os.path.basename(os.path.dirname(new_paths[0]))]
+
+    asyncio.run(main())